@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import functools
+import hashlib
+import json
 import os
 import re
 import sys
@@ -7,6 +10,8 @@ import pandas as pd
 
 RAW_PATH = "data/raw/ethiopia_fi_unified_data.csv"
 OUT_PATH = "data/processed/ethiopia_fi_unified_data_enriched.csv"
+OUT_PARQUET_PATH = "data/processed/ethiopia_fi_unified_data_enriched.parquet"
+SIG_PATH = "data/processed/.enrich.sig"
 
 COLLECTED_BY = "AbbyGailErm"
 COLLECTION_DATE = "2026-02-03"
@@ -14,51 +19,256 @@ COLLECTION_DATE = "2026-02-03"
 ID_COL = "record_id"
 DATE_COL = "observation_date"
 
+CATEGORY_COLS = [
+    "record_type", "category", "pillar", "gender", "location", "confidence", "source_type",
+]
+
+# Stored as numbers in the Parquet output (INT_COLS as nullable integers)
+NUMERIC_COLS = ["value_numeric", "impact_magnitude", "impact_estimate", "lag_months"]
+INT_COLS = ["lag_months"]
+
+# pd.read_csv's default na_values, so the pyarrow and C-engine reads agree
+PANDAS_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+ID_PAT = re.compile(r"^([A-Z]+)_(\d+)$")
+DATE_PAT = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Events added only if their indicator_code is not already present
+OPTIONAL_EVENTS: list[dict] = [
+    dict(
+        indicator="Interoperable P2P transfers surpass ATM cash withdrawals",
+        indicator_code="EVT_INTEROP_CROSSOVER",
+        category="infrastructure",
+        event_date="2024-01-01",
+        source_name="(Add official source)",
+        source_type="news",
+        source_url="(ADD_URL)",
+        original_text="Interoperable P2P digital transfers have surpassed ATM cash withdrawals.",
+        confidence="low",
+        notes="Replace (ADD_URL) and date with an official publication/press release.",
+    ),
+    dict(
+        indicator="Fayda Digital ID rollout milestone",
+        indicator_code="EVT_FAYDA_ROLLOUT",
+        category="policy",
+        event_date="2023-01-01",
+        source_name="Fayda/NIDP",
+        source_type="policy",
+        source_url="https://www.id.gov.et/",
+        original_text="Fayda digital ID program rollout (milestone date).",
+        confidence="medium",
+        notes="Replace with a verified milestone date/quote from id.gov.et once located.",
+    ),
+]
+
+# (parent event code, pillar, related indicator, direction, magnitude, lag months, evidence basis)
+LINK_SPECS: list[tuple[str, str, str, str, float, int, str]] = [
+    (
+        "EVT_TELEBIRR", "ACCESS", "ACC_MM_ACCOUNT",
+        "positive", 2.0, 6,
+        "Telebirr launch expected to raise mobile money account ownership after onboarding/agent rollout lag.",
+    ),
+    (
+        "EVT_TELEBIRR", "USAGE", "USG_DIGITAL_PAYMENT",
+        "positive", 3.0, 6,
+        "Mobile money launch expands payment capability; lag reflects time for adoption and ecosystem growth.",
+    ),
+    (
+        "EVT_SAFARICOM", "USAGE", "USG_MPESA_USERS",
+        "positive", 1.0, 6,
+        "New operator entry increases distribution and product competition; effects realized after rollout.",
+    ),
+    (
+        "EVT_INTEROP_CROSSOVER", "USAGE", "USG_DIGITAL_PAYMENT",
+        "positive", 2.0, 0,
+        "Interoperability milestone indicates mainstreaming of digital P2P vs cash withdrawals.",
+    ),
+    (
+        "EVT_FAYDA_ROLLOUT", "ACCESS", "ACC_OWNERSHIP",
+        "positive", 1.0, 12,
+        "Digital ID reduces KYC barriers; expected gradual effect on formal account ownership.",
+    ),
+]
+
 def ensure_dirs() -> None:
     os.makedirs("data/processed", exist_ok=True)
 
-def mk_base_row(cols: list[str]) -> dict:
+def mangle_dupe_cols(names: list[str]) -> list[str]:
+    """
+    Rename repeated column names the way pd.read_csv does: a, a -> a, a.1.
+    """
+    counts: dict[str, int] = {}
+    out: list[str] = []
+    for name in names:
+        cur_count = counts.get(name, 0)
+        while cur_count > 0:
+            counts[name] = cur_count + 1
+            name = f"{name}.{cur_count}"
+            cur_count = counts.get(name, 0)
+        counts[name] = cur_count + 1
+        out.append(name)
+    return out
+
+def read_raw(path: str) -> pd.DataFrame:
+    """
+    Read the raw CSV with the multi-threaded pyarrow parser, falling back to the C parser.
+    Everything is read as text (empty cells stay null) so values round-trip unchanged.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        df = pd.read_csv(path, dtype=str, low_memory=False)
+    else:
+        # pd.read_csv(engine="pyarrow", dtype=str) infers types first and then casts,
+        # turning nulls into "None"/"nan"; declare every column as string up front instead.
+        # Duplicate header names get pandas-style ".1" suffixes so column_types is unambiguous.
+        with pa_csv.open_csv(path) as reader:
+            header = mangle_dupe_cols(reader.schema.names)
+        table = pa_csv.read_csv(
+            path,
+            read_options=pa_csv.ReadOptions(column_names=header, skip_rows=1),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={c: pa.string() for c in header},
+                null_values=PANDAS_NA_VALUES,
+                strings_can_be_null=True,
+            ),
+        )
+        df = table.to_pandas()
+
+    return as_categories(df)
+
+def as_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Low-cardinality labels as categoricals: smaller, and masks compare integer codes.
+    Reapply after concatenating new rows, which falls back to plain strings.
+    """
+    return df.astype({c: "category" for c in CATEGORY_COLS if c in df.columns})
+
+def write_parquet(df: pd.DataFrame, path: str) -> bool:
+    """
+    Write the enriched table as zstd-compressed Parquet (primary artifact; the CSV is kept for compatibility).
+    Returns False without writing if pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return False
+
+    # Numeric fields are read as text; store them as numbers unless a cell isn't numeric
+    # (a fractional lag_months stays float rather than Int64)
+    typed: dict[str, pd.Series] = {}
+    for c in NUMERIC_COLS:
+        if c not in df.columns:
+            continue
+        try:
+            typed[c] = pd.to_numeric(df[c])
+            if c in INT_COLS:
+                typed[c] = typed[c].astype("Int64")
+        except (ValueError, TypeError):
+            pass
+    out = df.assign(**typed)
+
+    # Everything else left as object is genuine text; store it as strings
+    text_cols = {c: "string" for c in out.columns if out[c].dtype == object}
+    table = pa.Table.from_pandas(out.astype(text_cols), preserve_index=False)
+    pq.write_table(table, path, compression="zstd", compression_level=3)
+    return True
+
+def enrich_signature(raw_path: str, new_rows: list[dict]) -> str:
+    """
+    Fingerprint of one run: this script's source, raw file mtime and every appended row.
+    Hashing the source means any change to the transform invalidates earlier outputs.
+    """
+    with open(__file__, "rb") as f:
+        h = hashlib.sha256(f.read())
+    h.update(repr(os.path.getmtime(raw_path)).encode())
+    for row in new_rows:
+        h.update(repr([str(v) for v in row.values()]).encode())
+    return h.hexdigest()
+
+def output_stats(paths: list[str]) -> dict[str, list[int]] | None:
+    """
+    Size and mtime of each output, or None if any is missing.
+    Detects outputs replaced since the last run (e.g. a git checkout of the tracked CSV).
+    """
+    stats: dict[str, list[int]] = {}
+    for p in paths:
+        if not os.path.exists(p):
+            return None
+        st = os.stat(p)
+        stats[p] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+def read_signature(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        return None  # unreadable or older format; treat as no signature
+
+def write_signature(path: str, sig: str, outputs: list[str]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"signature": sig, "outputs": output_stats(outputs)}, f)
+
+@functools.lru_cache(maxsize=8)
+def base_row_template(cols: tuple[str, ...]) -> dict:
     return {c: pd.NA for c in cols}
 
-def next_id(existing_ids: pd.Series, prefix: str) -> str:
+def mk_base_row(cols: list[str]) -> dict:
+    # Copy the cached all-NA template; callers mutate the returned row
+    return base_row_template(tuple(cols)).copy()
+
+def scan_id_counters(existing_ids: pd.Series) -> dict[str, int]:
     """
-    Generate next ID of form PREFIX_0001 based on existing record_id values.
-    Works for REC_, EVT_, LNK_.
+    Find the highest numeric suffix per prefix among existing record_id values.
+    Run once at startup; IDs are then allocated with alloc_id.
     """
-    ids = existing_ids.dropna().astype(str).tolist()
-    nums: list[int] = []
-    pat = re.compile(rf"^{re.escape(prefix)}_(\d+)$")
-    for x in ids:
-        m = pat.match(x)
+    counters: dict[str, int] = {"REC": 0, "EVT": 0, "LNK": 0}
+    for x in existing_ids.dropna().tolist():
+        m = ID_PAT.match(x)
         if m:
-            try:
-                nums.append(int(m.group(1)))
-            except ValueError:
-                pass
-    nxt = (max(nums) + 1) if nums else 1
-    return f"{prefix}_{nxt:04d}"
-
-def fix_collector_fields(df: pd.DataFrame) -> pd.DataFrame:
+            prefix, num = m.group(1), int(m.group(2))
+            counters[prefix] = max(counters.get(prefix, 0), num)
+    return counters
+
+def alloc_id(counters: dict[str, int], prefix: str) -> str:
+    """
+    Generate next ID of form PREFIX_0001 and advance the counter.
+    Works for REC_, EVT_, LNK_.
+    """
+    counters[prefix] = counters.get(prefix, 0) + 1
+    return f"{prefix}_{counters[prefix]:04d}"
+
+def fix_collector_fields(df: pd.DataFrame, *, copy: bool = False) -> pd.DataFrame:
     """
     In your sample, collected_by contains a date and collection_date is null.
     This corrects rows where collected_by looks like YYYY-MM-DD and collection_date is missing.
+    Mutates and returns df unless copy=True, in which case df is left untouched.
     """
-    out = df.copy()
+    out = df.copy() if copy else df
     if "collected_by" not in out.columns or "collection_date" not in out.columns:
         return out
 
+    collected_by = out["collected_by"]
     mask = (
-        out["collected_by"].astype(str).str.match(r"^\d{4}-\d{2}-\d{2}$", na=False)
+        collected_by.str.fullmatch(DATE_PAT, na=False)
         & out["collection_date"].isna()
     )
-    out.loc[mask, "collection_date"] = out.loc[mask, "collected_by"]
+    out.loc[mask, "collection_date"] = collected_by[mask]
     out.loc[mask, "collected_by"] = "Example_Trainee"
     return out
 
 def add_event(
-    df: pd.DataFrame,
     cols: list[str],
     *,
+    record_id: str,
     indicator: str,
     indicator_code: str,
     category: str,
@@ -69,9 +279,12 @@ def add_event(
     original_text: str,
     confidence: str = "medium",
     notes: str = "",
-) -> tuple[pd.DataFrame, dict]:
+) -> dict:
+    if not DATE_PAT.fullmatch(event_date):
+        raise ValueError(f"event_date must be YYYY-MM-DD, got {event_date!r}")
+
     row = mk_base_row(cols)
-    row[ID_COL] = next_id(df[ID_COL], "EVT")
+    row[ID_COL] = record_id
     row["record_type"] = "event"
     row["category"] = category
     row["pillar"] = pd.NA  # events should not be assigned to pillars
@@ -81,7 +294,7 @@ def add_event(
     row["value_text"] = "Occurred"
     row["value_type"] = "categorical"
     row[DATE_COL] = event_date
-    row["fiscal_year"] = str(pd.to_datetime(event_date).year)
+    row["fiscal_year"] = event_date[:4]
 
     row["gender"] = "all"
     row["location"] = "national"
@@ -97,13 +310,12 @@ def add_event(
     row["original_text"] = original_text
     row["notes"] = notes
 
-    df2 = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-    return df2, row
+    return row
 
 def add_impact_link(
-    df: pd.DataFrame,
     cols: list[str],
     *,
+    record_id: str,
     parent_id: str,
     pillar: str,
     related_indicator: str,
@@ -115,9 +327,9 @@ def add_impact_link(
     comparable_country: str = "Ethiopia",
     confidence: str = "medium",
     notes: str = "",
-) -> tuple[pd.DataFrame, dict]:
+) -> dict:
     row = mk_base_row(cols)
-    row[ID_COL] = next_id(df[ID_COL], "LNK")
+    row[ID_COL] = record_id
     row["record_type"] = "impact_link"
     row["parent_id"] = parent_id
 
@@ -135,8 +347,7 @@ def add_impact_link(
     row["collection_date"] = COLLECTION_DATE
     row["notes"] = notes or "Impact link added for event-augmented modeling; calibrate in Task 3."
 
-    df2 = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-    return df2, row
+    return row
 
 def main() -> int:
     ensure_dirs()
@@ -145,7 +356,7 @@ def main() -> int:
         print(f"[ERROR] Raw dataset not found at: {RAW_PATH}", file=sys.stderr)
         return 2
 
-    df = pd.read_csv(RAW_PATH)
+    df = read_raw(RAW_PATH)
     cols = df.columns.tolist()
 
     for required in [ID_COL, "record_type", "indicator_code", DATE_COL]:
@@ -153,86 +364,54 @@ def main() -> int:
             print(f"[ERROR] Missing required column: {required}", file=sys.stderr)
             return 2
 
-    df = fix_collector_fields(df)
+    fix_collector_fields(df, copy=False)
+
+    # New rows are collected here and concatenated once before writing
+    new_rows: list[dict] = []
+    id_counters = scan_id_counters(df[ID_COL])
 
     # Build event lookup by indicator_code
-    events = df[df["record_type"].eq("event")].copy()
-    event_code_to_id = (
-        events[[ID_COL, "indicator_code"]]
-        .dropna(subset=["indicator_code"])
-        .set_index("indicator_code")[ID_COL]
-        .to_dict()
+    events = df.loc[df["record_type"].eq("event"), [ID_COL, "indicator_code"]].dropna(
+        subset=["indicator_code"]
+    )
+    event_code_to_id = dict(
+        zip(events["indicator_code"].tolist(), events[ID_COL].tolist())
     )
 
     # 1) Add optional missing events (only if absent)
-    if "EVT_INTEROP_CROSSOVER" not in event_code_to_id:
-        df, evt = add_event(
-            df, cols,
-            indicator="Interoperable P2P transfers surpass ATM cash withdrawals",
-            indicator_code="EVT_INTEROP_CROSSOVER",
-            category="infrastructure",
-            event_date="2024-01-01",
-            source_name="(Add official source)",
-            source_type="news",
-            source_url="(ADD_URL)",
-            original_text="Interoperable P2P digital transfers have surpassed ATM cash withdrawals.",
-            confidence="low",
-            notes="Replace (ADD_URL) and date with an official publication/press release."
-        )
-        event_code_to_id["EVT_INTEROP_CROSSOVER"] = evt[ID_COL]
-
-    if "EVT_FAYDA_ROLLOUT" not in event_code_to_id:
-        df, evt = add_event(
-            df, cols,
-            indicator="Fayda Digital ID rollout milestone",
-            indicator_code="EVT_FAYDA_ROLLOUT",
-            category="policy",
-            event_date="2023-01-01",
-            source_name="Fayda/NIDP",
-            source_type="policy",
-            source_url="https://www.id.gov.et/",
-            original_text="Fayda digital ID program rollout (milestone date).",
-            confidence="medium",
-            notes="Replace with a verified milestone date/quote from id.gov.et once located."
-        )
-        event_code_to_id["EVT_FAYDA_ROLLOUT"] = evt[ID_COL]
-
-    # Refresh lookup
-    events = df[df["record_type"].eq("event")].copy()
-    event_code_to_id = (
-        events[[ID_COL, "indicator_code"]]
-        .dropna(subset=["indicator_code"])
-        .set_index("indicator_code")[ID_COL]
-        .to_dict()
-    )
+    for spec in OPTIONAL_EVENTS:
+        if spec["indicator_code"] in event_code_to_id:
+            continue
+        evt = add_event(cols, record_id=alloc_id(id_counters, "EVT"), **spec)
+        new_rows.append(evt)
+        event_code_to_id[spec["indicator_code"]] = evt[ID_COL]
 
     # 2) Add impact links if missing
-    existing_links = df[df["record_type"].eq("impact_link")].copy()
-    existing_link_keys = set(
-        zip(
-            existing_links.get("parent_id", pd.Series(dtype=str)).astype(str),
-            existing_links.get("related_indicator", pd.Series(dtype=str)).astype(str),
+    existing_link_keys: set[tuple[str, str]] = set()
+    if "parent_id" in df.columns and "related_indicator" in df.columns:
+        existing_links = df.loc[
+            df["record_type"].eq("impact_link"), ["parent_id", "related_indicator"]
+        ].dropna()
+        existing_link_keys = set(
+            zip(
+                existing_links["parent_id"].tolist(),
+                existing_links["related_indicator"].tolist(),
+            )
         )
-    )
 
-    def maybe_add_link(
-        parent_event_code: str,
-        pillar: str,
-        related_indicator: str,
-        impact_direction: str,
-        impact_magnitude: float,
-        lag_months: int,
-        evidence_basis: str,
-    ) -> None:
-        nonlocal df
-        if parent_event_code not in event_code_to_id:
-            return
-        pid = event_code_to_id[parent_event_code]
-        key = (str(pid), str(related_indicator))
+    for (
+        parent_event_code, pillar, related_indicator,
+        impact_direction, impact_magnitude, lag_months, evidence_basis,
+    ) in LINK_SPECS:
+        pid = event_code_to_id.get(parent_event_code)
+        if pid is None:
+            continue
+        key = (str(pid), related_indicator)
         if key in existing_link_keys:
-            return
-        df, _ = add_impact_link(
-            df, cols,
+            continue
+        new_rows.append(add_impact_link(
+            cols,
+            record_id=alloc_id(id_counters, "LNK"),
             parent_id=pid,
             pillar=pillar,
             related_indicator=related_indicator,
@@ -240,37 +419,38 @@ def main() -> int:
             impact_magnitude=impact_magnitude,
             lag_months=lag_months,
             evidence_basis=evidence_basis,
+        ))
+        existing_link_keys.add(key)
+
+    if new_rows:
+        # Keep fields the raw header lacks (e.g. parent_id); they become new columns
+        new_cols = cols + [k for k in dict.fromkeys(k for r in new_rows for k in r) if k not in cols]
+        df = as_categories(
+            pd.concat([df, pd.DataFrame(new_rows, columns=new_cols)], ignore_index=True)
         )
 
-    maybe_add_link(
-        "EVT_TELEBIRR", "ACCESS", "ACC_MM_ACCOUNT",
-        "positive", 2.0, 6,
-        "Telebirr launch expected to raise mobile money account ownership after onboarding/agent rollout lag."
-    )
-    maybe_add_link(
-        "EVT_TELEBIRR", "USAGE", "USG_DIGITAL_PAYMENT",
-        "positive", 3.0, 6,
-        "Mobile money launch expands payment capability; lag reflects time for adoption and ecosystem growth."
-    )
-    maybe_add_link(
-        "EVT_SAFARICOM", "USAGE", "USG_MPESA_USERS",
-        "positive", 1.0, 6,
-        "New operator entry increases distribution and product competition; effects realized after rollout."
-    )
-    maybe_add_link(
-        "EVT_INTEROP_CROSSOVER", "USAGE", "USG_DIGITAL_PAYMENT",
-        "positive", 2.0, 0,
-        "Interoperability milestone indicates mainstreaming of digital P2P vs cash withdrawals."
-    )
-    maybe_add_link(
-        "EVT_FAYDA_ROLLOUT", "ACCESS", "ACC_OWNERSHIP",
-        "positive", 1.0, 12,
-        "Digital ID reduces KYC barriers; expected gradual effect on formal account ownership."
-    )
-
+    # Skip rewriting when the raw file and the appended rows match the last run and the
+    # outputs are still the files it wrote. Without pyarrow no signature is stored, so this never skips
+    sig = enrich_signature(RAW_PATH, new_rows)
+    outputs = [OUT_PATH, OUT_PARQUET_PATH]
+    if read_signature(SIG_PATH) == {"signature": sig, "outputs": output_stats(outputs)}:
+        print(f"Unchanged: {OUT_PARQUET_PATH}")
+        print(f"Unchanged: {OUT_PATH}")
+        print(df["record_type"].value_counts(dropna=False).to_string())
+        return 0
+
+    wrote_parquet = write_parquet(df, OUT_PARQUET_PATH)
     df.to_csv(OUT_PATH, index=False)
+    if wrote_parquet:
+        write_signature(SIG_PATH, sig, outputs)
+    elif os.path.exists(SIG_PATH):
+        os.remove(SIG_PATH)  # an artifact was skipped; force a full write next run
 
     # Print summary (so you always see something)
+    if wrote_parquet:
+        print(f"Wrote: {OUT_PARQUET_PATH}")
+    else:
+        print("[WARN] pyarrow not installed; skipped Parquet output", file=sys.stderr)
     print(f"Wrote: {OUT_PATH}")
     print(df["record_type"].value_counts(dropna=False).to_string())
 